@@ -1,50 +1,227 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-import joblib
 import os
+import csv
+import threading
 from datetime import date
-import shap
 import numpy as np
 
 st.set_page_config(page_title="HealthPredict", layout="wide")
 
-@st.cache_data
+DATA_COLUMNS = [
+    "patient", "Date", "Height_cm", "BMI", "Weight_kg", "Diastolic_BP", "Heart_Rate", "Systolic_BP",
+    "Smoking_Status", "Diabetes", "Hyperlipidemia", "Heart_Disease", "AGE", "GENDER", "Health Score"
+]
+
+# Bump the version whenever the cleaning in load_data changes so stale caches are rebuilt.
+DATA_CACHE = "Cleaned_Dataset.v3.parquet"
+
+@st.cache_resource
 def load_data():
-    df = pd.read_csv("Cleaned_Dataset.csv")
+    # The parquet copy keeps the cleaned dtypes, so only rebuild it when the CSV is newer.
+    if os.path.exists(DATA_CACHE) and os.path.getmtime(DATA_CACHE) >= os.path.getmtime("Cleaned_Dataset.csv"):
+        try:
+            return pd.read_parquet(DATA_CACHE, engine="pyarrow", columns=DATA_COLUMNS)
+        except (OSError, ValueError):
+            pass  # unreadable or truncated cache: rebuild it from the CSV below
+
+    df = pd.read_csv("Cleaned_Dataset.csv", usecols=DATA_COLUMNS)
     df["Date"] = pd.to_datetime(df["Date"], errors="coerce")
+    df["patient"] = df["patient"].astype(str)
+    for c in ("GENDER", "Smoking_Status"):
+        df[c] = df[c].astype("category")
+    for c in ("Diabetes", "Hyperlipidemia", "Heart_Disease"):
+        df[c] = df[c].astype(np.int8)
+    for c in ("AGE", "Heart_Rate", "Systolic_BP", "Diastolic_BP", "Health Score"):
+        df[c] = pd.to_numeric(df[c], downcast="integer")
+    df = df.sort_values(["patient", "Date"], ignore_index=True)
+    # Write to a temp file and swap it in, so readers never see a partial cache.
+    tmp_path = f"{DATA_CACHE}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, engine="pyarrow", index=False)
+        os.replace(tmp_path, DATA_CACHE)
+    except OSError:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
     return df
 
+@st.cache_resource(show_spinner=False)
+def get_model():
+    import joblib  # deferred: unpickling also pulls in xgboost and sklearn
+
+    model = joblib.load("Heart_Disease_Risk_Model_XGBoost.pkl")
+    # Map each transformed column back to its source feature for the contributor pie.
+    feature_names = model[:-1].get_feature_names_out(model.feature_names_in_)
+    base_names = [f.split("__")[1].split("_")[0] if "__" in f else f for f in feature_names]
+    return model, base_names
+
+@st.cache_resource
+def start_warmup():
+    # Runs once per process: load the model off the script thread so the
+    # first dashboard render does not pay for unpickling.
+    thread = threading.Thread(target=get_model, daemon=True)
+    thread.start()
+    return thread
+
+@st.cache_resource
+def patient_groups():
+    return {pid: visits for pid, visits in load_data().groupby("patient", sort=False)}
+
+@st.cache_resource
+def patient_stats():
+    return load_data().groupby("patient").agg(n_visits=("Date", "size"), avg_hs=("Health Score", "mean"))
+
 df = load_data()
+start_warmup()
+
+TREND_METRICS = ["Health Score", "BMI", "Systolic_BP", "Heart_Rate"]
+TOP_K_OPTIONS = [2, 3, 4, 5, 6, 7, 8]
+
+@st.cache_data
+def visit_metric_series(patient_id):
+    visits = patient_groups()[patient_id].set_index("Date")
+    return {m: visits[m] for m in TREND_METRICS}
 
+@st.cache_data
+def visit_flags(patient_id):
+    # Risk-factor flags for every visit, shared by the Overview (last row) and Visit History.
+    visits = patient_groups()[patient_id]
+    return pd.DataFrame({
+        "bmi_high": visits["BMI"] > 25,
+        "bmi_low": visits["BMI"] < 18.5,
+        "hr": visits["Heart_Rate"] > 90,
+        "bp": (visits["Systolic_BP"] > 130) | (visits["Diastolic_BP"] > 85),
+        "smoking": visits["Smoking_Status"].str.contains("current", case=False, na=False).astype(bool),
+        "diabetes": visits["Diabetes"].astype(bool),
+        "lipid": visits["Hyperlipidemia"].astype(bool),
+    })
+
+# Overview recommendations, in the same order as the insight_flags tuple in show_dashboard,
+# which picks columns of visit_flags().
+INSIGHT_TIPS = (
+    "• High BMI – focus on diet and exercise.",
+    "• Elevated heart rate – reduce stress.",
+    "• High BP – reduce salt and monitor.",
+    "• Smoking – quit to reduce heart risk.",
+    "• Diabetes – monitor sugar, follow meds.",
+    "• Hyperlipidemia – adopt a low-fat diet.",
+)
+
+# Visit-history tips, in the same order as the masks built in show_dashboard.
+VISIT_TIPS = (
+    "• Maintain healthy BMI.",
+    "• Reduce resting heart rate.",
+    "• Manage blood pressure.",
+    "• Stop smoking.",
+    "• Monitor cholesterol.",
+    "• Track glucose levels.",
+)
+
+_VISIT_CARD = (
+    "<div style='border:1px solid #ccc; border-radius:10px; padding:10px; background:#f9f9f9; margin:10px 0;'>"
+    "<b>Date:</b> %s<br>"
+    "<b>BMI:</b> %.1f, <b>BP:</b> %s/%s, <b>HR:</b> %s<br>"
+    "<b>Health Score:</b> %s, <b>Risk:</b> <span style='color:white; background:%s; padding:2px 6px; border-radius:4px;'>%s</span><br>"
+    "<b>Tips:</b> <br>%s"
+    "</div>"
+)
+
+_DONUT_LAYOUT = go.Layout(margin=dict(t=10, b=10, l=10, r=10), height=200, width=200)
+
+@st.cache_data(max_entries=64)
 def donut_chart(label, value, color):
-    fig = go.Figure(go.Pie(
-        values=[value, 100 - value],
-        labels=["", ""],
-        hole=0.7,
-        marker_colors=[color, "#e0e0e0"],
-        textinfo="none"
-    ))
+    fig = go.Figure(
+        data=[go.Pie(
+            values=[value, 100 - value],
+            labels=["", ""],
+            hole=0.7,
+            marker_colors=[color, "#e0e0e0"],
+            textinfo="none"
+        )],
+        layout=_DONUT_LAYOUT
+    )
     fig.update_layout(
-        annotations=[dict(text=f"<b>{label}<br>{int(value)}%</b>", showarrow=False, font_size=14)],
-        margin=dict(t=10, b=10, l=10, r=10),
-        height=200, width=200
+        annotations=[dict(text=f"<b>{label}<br>{int(value)}%</b>", showarrow=False, font_size=14)]
     )
     return fig
 
+@st.cache_resource
+def appointment_writer():
+    # One append handle per process; the lock serialises writes from concurrent sessions.
+    f = open("appointments.csv", "a", newline="")
+    writer = csv.writer(f)
+    if f.tell() == 0:
+        writer.writerow(["Patient_ID", "Doctor", "Date", "Notes"])
+        f.flush()
+    return f, writer, threading.Lock()
+
 def save_appointment(patient_id, doctor, appt_date, notes):
-    record = pd.DataFrame([{
-        "Patient_ID": patient_id,
-        "Doctor": doctor,
-        "Date": appt_date,
-        "Notes": notes
-    }])
-    if os.path.exists("appointments.csv"):
-        record.to_csv("appointments.csv", mode='a', header=False, index=False)
-    else:
-        record.to_csv("appointments.csv", index=False)
+    f, writer, lock = appointment_writer()
+    with lock:
+        writer.writerow([patient_id, doctor, appt_date, notes])
+        f.flush()
+
+FEATURES = [
+    "Height_cm", "Weight_kg", "BMI", "Systolic_BP", "Diastolic_BP",
+    "Heart_Rate", "Smoking_Status", "Diabetes", "Hyperlipidemia", "AGE", "GENDER"
+]
+
+# Dtypes the pipeline was fitted with. load_data narrows columns for memory and display only.
+MODEL_DTYPES = {c: "float64" for c in FEATURES}
+MODEL_DTYPES.update({"Smoking_Status": str, "GENDER": str})
 
-if 'logged_in' not in st.session_state:
+def model_input(visits):
+    # BMI, Height_cm and Weight_kg stay float64 in load_data: the trees split exactly
+    # on the training values, so even a float32 round-trip changes predictions.
+    return visits[FEATURES].astype(MODEL_DTYPES)
+
+@st.cache_data(max_entries=64)
+def compute_risk_and_shap(features, _latest_visit):
+    # get_model() first: its cache lock waits for the warmup thread, which imports
+    # xgboost while unpickling; importing it concurrently here fails.
+    model, base_names = get_model()
+    import xgboost as xgb
+
+    preprocessor = model[:-1]
+    xgb_model = model.named_steps["classifier"]
+
+    # Transform once and feed the same matrix to the classifier and to SHAP.
+    # model_input only widens exact types (integers, categories); a lossy
+    # float32 column cannot be repaired by casting it back.
+    input_df = model_input(_latest_visit)
+    transformed = preprocessor.transform(input_df)
+
+    booster = xgb_model.get_booster()
+    proba = float(booster.inplace_predict(transformed)[0])
+    risk = proba * 100
+    # Same decision rule XGBClassifier.predict applies to binary probabilities.
+    label = "High Risk" if proba > 0.5 else "Low Risk"
+
+    # XGBoost's native TreeSHAP; the last column is the bias term.
+    shap_values = booster.predict(xgb.DMatrix(transformed), pred_contribs=True)[:, :-1]
+
+    mean_abs = np.abs(shap_values, dtype=np.float32).mean(axis=0)
+
+    importance_df = pd.DataFrame({"feature": base_names, "value": mean_abs})
+    importance_df = importance_df.groupby("feature")["value"].sum().sort_values(ascending=False)
+    importance_df = importance_df[~importance_df.index.str.lower().str.contains("height")]
+    return risk, label, importance_df
+
+@st.cache_data(max_entries=64)
+def contributors_pie(features, top_k, _latest_visit):
+    _, _, importance_df = compute_risk_and_shap(features, _latest_visit)
+    labels = importance_df.head(top_k).index.tolist()
+    values = importance_df.head(top_k).values.tolist()
+    if len(importance_df) > top_k:
+        labels.append("Others")
+        values.append(importance_df.iloc[top_k:].sum())
+
+    pie = go.Figure(data=[go.Pie(labels=labels, values=values, hole=0.4)])
+    pie.update_layout(margin=dict(t=10, b=10, l=10, r=10), height=220)
+    return pie
+
+if __name__ == "__main__" and 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
     st.session_state.patient_id = ""
 
@@ -52,7 +229,7 @@ def show_login():
     st.title("Welcome to HealthPredict")
     patient_id = st.text_input("Enter Patient ID")
     if st.button("Login"):
-        if patient_id in df["patient"].astype(str).values:
+        if patient_id in patient_groups():
             st.session_state.logged_in = True
             st.session_state.patient_id = patient_id
             st.rerun()
@@ -60,22 +237,30 @@ def show_login():
             st.error("Invalid Patient ID. Please try again.")
 
 def show_dashboard(patient_id):
-    patient_df = df[df["patient"].astype(str) == patient_id].sort_values("Date")
+    patient_df = patient_groups()[patient_id]
     latest = patient_df.iloc[-1]
 
-    tab1, tab2 = st.tabs(["Overview", "Visit History"])
+    with st.sidebar:
+        st.markdown("## Book Appointment")
+        doctor = st.selectbox("Choose Doctor", ["Cardiologist", "General Physician", "Dietician"])
+        appt_date = st.date_input("Select Date", min_value=date.today())
+        notes = st.text_input("Notes (optional)")
+        if st.button("Book Appointment"):
+            save_appointment(patient_id, doctor, appt_date, notes)
+            st.success(f"Appointment booked with {doctor} on {appt_date.strftime('%b %d, %Y')}")
 
-    with tab1:
-        with st.sidebar:
-            st.markdown("## Book Appointment")
-            doctor = st.selectbox("Choose Doctor", ["Cardiologist", "General Physician", "Dietician"])
-            appt_date = st.date_input("Select Date", min_value=date.today())
-            notes = st.text_input("Notes (optional)")
-            if st.button("Book Appointment"):
-                save_appointment(patient_id, doctor, appt_date, notes)
-                st.success(f"Appointment booked with {doctor} on {appt_date.strftime('%b %d, %Y')}")
+    # Tabs built with st.tabs render every panel on each rerun, so the active
+    # view is tracked with a radio and only the selected panel is computed.
+    # Streamlit drops the state of widgets that are not rendered, so each view's
+    # selector mirrors its value into a saved_* key and is re-seeded from it.
+    view = st.radio("View", ["Overview", "Visit History"], horizontal=True, label_visibility="collapsed")
 
-            top_k = st.selectbox("Top SHAP Features", options=[2, 3, 4, 5, 6, 7, 8], index=2)
+    if view == "Overview":
+        top_k = st.sidebar.selectbox(
+            "Top SHAP Features", options=TOP_K_OPTIONS,
+            index=TOP_K_OPTIONS.index(st.session_state.get("saved_top_k", 4)), key="top_k"
+        )
+        st.session_state.saved_top_k = top_k
 
         st.markdown("<h2 style='text-align:center;'>Welcome to HealthPredict</h2>", unsafe_allow_html=True)
 
@@ -103,12 +288,12 @@ def show_dashboard(patient_id):
                     ID: {id}<br>
                     Age: {age}<br>
                     Gender: {gender}<br>
-                    Height: {height} cm<br>
-                    Weight: {weight} kg
+                    Height: {height:.1f} cm<br>
+                    Weight: {weight:.1f} kg
                 </div>
                 <div class='card'>
                     <h4>Health Metrics</h4>
-                    BMI: {bmi}<br>
+                    BMI: {bmi:.1f}<br>
                     BP: {bp}<br>
                     Heart Rate: {hr} bpm<br>
                     Smoking: {smoking}
@@ -143,51 +328,25 @@ def show_dashboard(patient_id):
             st.markdown("### Health Score")
             score = latest["Health Score"]
             color = "#4caf50" if score >= 80 else "#ffa94d" if score >= 60 else "#ff4d4d"
-            st.plotly_chart(donut_chart("Score", score, color), use_container_width=True)
+            st.plotly_chart(donut_chart("Score", int(score), color), use_container_width=True)
             st.markdown("</div>", unsafe_allow_html=True)
 
+        # Keyed on the feature values, so reruns for an unchanged visit skip the model and SHAP.
+        features = tuple(latest[FEATURES])
+        latest_visit = patient_df.iloc[[-1]]
+        risk, label, _ = compute_risk_and_shap(features, latest_visit)
+        pie = contributors_pie(features, top_k, latest_visit)
+
         with col2:
             st.markdown("<div class='card'>", unsafe_allow_html=True)
             st.markdown("### Heart Risk")
-            model = joblib.load("Heart_Disease_Risk_Model_XGBoost.pkl")
-            input_df = pd.DataFrame([{k: latest[k] for k in [
-                "Height_cm", "Weight_kg", "BMI", "Systolic_BP", "Diastolic_BP",
-                "Heart_Rate", "Smoking_Status", "Diabetes", "Hyperlipidemia", "AGE", "GENDER"]}])
-            risk = model.predict_proba(input_df)[0][1] * 100
-            label = "High Risk" if model.predict(input_df)[0] == 1 else "Low Risk"
             risk_color = "#ff4d4d" if label == "High Risk" else "#4caf50"
-            st.plotly_chart(donut_chart(label, risk, risk_color), use_container_width=True)
+            st.plotly_chart(donut_chart(label, int(risk), risk_color), use_container_width=True)
             st.markdown("</div>", unsafe_allow_html=True)
 
         with col3:
             st.markdown("<div class='card'>", unsafe_allow_html=True)
             st.markdown("### Top Risk Contributors")
-            preprocessor = model[:-1]
-            xgb_model = model.named_steps["classifier"]
-
-            # SHAP input: keep all features for transform
-            shap_input_df = input_df.copy()
-            transformed = preprocessor.transform(shap_input_df)
-
-            explainer = shap.TreeExplainer(xgb_model)
-            shap_values = explainer.shap_values(transformed)
-
-            feature_names = preprocessor.get_feature_names_out(model.feature_names_in_)
-            base_names = [f.split("__")[1].split("_")[0] if "__" in f else f for f in feature_names]
-            mean_abs = np.abs(shap_values).mean(axis=0)
-
-            importance_df = pd.DataFrame({"feature": base_names, "value": mean_abs})
-            importance_df = importance_df.groupby("feature")["value"].sum().sort_values(ascending=False)
-            importance_df = importance_df[~importance_df.index.str.lower().str.contains("height")]
-
-            labels = importance_df.head(top_k).index.tolist()
-            values = importance_df.head(top_k).values.tolist()
-            if len(importance_df) > top_k:
-                labels.append("Others")
-                values.append(importance_df.iloc[top_k:].sum())
-
-            pie = go.Figure(data=[go.Pie(labels=labels, values=values, hole=0.4)])
-            pie.update_layout(margin=dict(t=10, b=10, l=10, r=10), height=220)
             st.plotly_chart(pie, use_container_width=True)
             st.markdown("</div>", unsafe_allow_html=True)
 
@@ -202,60 +361,60 @@ def show_dashboard(patient_id):
             st.warning("⚠️ High score but elevated risk. Schedule a full check-up.")
         else:
             st.info("🔍 Low score but currently low risk. Improve your lifestyle.")
-        if latest["BMI"] > 25:
-            st.write("• High BMI – focus on diet and exercise.")
-        if latest["Heart_Rate"] > 90:
-            st.write("• Elevated heart rate – reduce stress.")
-        if latest["Systolic_BP"] > 130 or latest["Diastolic_BP"] > 85:
-            st.write("• High BP – reduce salt and monitor.")
-        if "current" in str(latest["Smoking_Status"]).lower():
-            st.write("• Smoking – quit to reduce heart risk.")
-        if latest["Diabetes"]:
-            st.write("• Diabetes – monitor sugar, follow meds.")
-        if latest["Hyperlipidemia"]:
-            st.write("• Hyperlipidemia – adopt a low-fat diet.")
+        last = visit_flags(patient_id).iloc[-1]
+        insight_flags = (
+            last["bmi_high"], last["hr"], last["bp"], last["smoking"], last["diabetes"], last["lipid"]
+        )
+        for tip, flag in zip(INSIGHT_TIPS, insight_flags):
+            if flag:
+                st.write(tip)
         st.markdown("</div>", unsafe_allow_html=True)
 
     # ------------------- Visit History -------------------
-    with tab2:
+    else:
         st.markdown("## Visit History")
-        st.info(f"Total Visits: {len(patient_df)} | Avg. Health Score: {round(patient_df['Health Score'].mean(), 1)}")
-        metric = st.selectbox("Metric to View Trend", ["Health Score", "BMI", "Systolic_BP", "Heart_Rate"])
-        st.line_chart(patient_df.set_index("Date")[metric])
-
-        for _, row in patient_df.iterrows():
-            risk = "High" if row["Heart_Disease"] == 1 else "Low"
-            color = "#ff4d4d" if risk == "High" else "#4caf50"
-            tips = []
-            if row["BMI"] < 18.5 or row["BMI"] > 25:
-                tips.append("• Maintain healthy BMI.")
-            if row["Heart_Rate"] > 90:
-                tips.append("• Reduce resting heart rate.")
-            if row["Systolic_BP"] > 130 or row["Diastolic_BP"] > 85:
-                tips.append("• Manage blood pressure.")
-            if "current" in str(row["Smoking_Status"]).lower():
-                tips.append("• Stop smoking.")
-            if row["Hyperlipidemia"]:
-                tips.append("• Monitor cholesterol.")
-            if row["Diabetes"]:
-                tips.append("• Track glucose levels.")
-            st.markdown(
-                f"""
-                <div style='border:1px solid #ccc; border-radius:10px; padding:10px; background:#f9f9f9; margin:10px 0;'>
-                <b>Date:</b> {row['Date'].date()}<br>
-                <b>BMI:</b> {row['BMI']}, <b>BP:</b> {row['Systolic_BP']}/{row['Diastolic_BP']}, <b>HR:</b> {row['Heart_Rate']}<br>
-                <b>Health Score:</b> {row['Health Score']}, <b>Risk:</b> <span style='color:white; background:{color}; padding:2px 6px; border-radius:4px;'>{risk}</span><br>
-                <b>Tips:</b> <br>{'<br>'.join(tips)}
-                </div>
-                """, unsafe_allow_html=True
-            )
+        stats = patient_stats().loc[patient_id]
+        st.info(f"Total Visits: {int(stats['n_visits'])} | Avg. Health Score: {round(stats['avg_hs'], 1)}")
+        metric = st.selectbox(
+            "Metric to View Trend", TREND_METRICS,
+            index=TREND_METRICS.index(st.session_state.get("saved_metric", "Health Score")), key="metric"
+        )
+        st.session_state.saved_metric = metric
+        st.line_chart(visit_metric_series(patient_id)[metric])
+
+        flags = visit_flags(patient_id)
+        tip_masks = [
+            (flags["bmi_low"] | flags["bmi_high"]).to_numpy(),
+            flags["hr"].to_numpy(),
+            flags["bp"].to_numpy(),
+            flags["smoking"].to_numpy(),
+            flags["lipid"].to_numpy(),
+            flags["diabetes"].to_numpy(),
+        ]
+        high_risk = (patient_df["Heart_Disease"] == 1).to_numpy()
+
+        cards = []
+        for visit_date, bmi, sys_bp, dia_bp, hr, health_score, high, *tip_flags in zip(
+            patient_df["Date"].dt.date, patient_df["BMI"], patient_df["Systolic_BP"],
+            patient_df["Diastolic_BP"], patient_df["Heart_Rate"], patient_df["Health Score"],
+            high_risk, *tip_masks
+        ):
+            risk = "High" if high else "Low"
+            color = "#ff4d4d" if high else "#4caf50"
+            tips = [tip for tip, flag in zip(VISIT_TIPS, tip_flags) if flag]
+            cards.append(_VISIT_CARD % (
+                visit_date, bmi, sys_bp, dia_bp, hr, health_score, color, risk, "<br>".join(tips)
+            ))
+        st.markdown("".join(cards), unsafe_allow_html=True)
 
     if st.button("Logout"):
         st.session_state.logged_in = False
         st.session_state.patient_id = ""
         st.rerun()
 
-if st.session_state.logged_in:
-    show_dashboard(st.session_state.patient_id)
-else:
-    show_login()
+# streamlit runs this file as __main__; check_predictions.py imports it for the helpers only.
+if __name__ == "__main__":
+    if st.session_state.logged_in:
+        show_dashboard(st.session_state.patient_id)
+    else:
+        show_login()
@@ -0,0 +1,64 @@
+"""Check that the dashboard's heart-risk output matches the original model path.
+
+The original app fed each visit to ``model.predict_proba`` / ``model.predict`` as a
+DataFrame built straight from the CSV. This script scores every row of the dataset
+both that way and through app.py's cleaned data and booster path, and exits
+non-zero if any label or displayed risk percentage differs.
+
+Run with: python check_predictions.py
+"""
+import sys
+
+import numpy as np
+import pandas as pd
+
+import app
+
+
+def _dense(x):
+    return x.toarray() if hasattr(x, "toarray") else np.asarray(x)
+
+
+def main():
+    model, _ = app.get_model()
+    preprocessor = model[:-1]
+    booster = model.named_steps["classifier"].get_booster()
+
+    # Same row order as load_data: the multi-column sort is stable.
+    raw = pd.read_csv("Cleaned_Dataset.csv")
+    raw["Date"] = pd.to_datetime(raw["Date"], errors="coerce")
+    raw["patient"] = raw["patient"].astype(str)
+    raw = raw.sort_values(["patient", "Date"], ignore_index=True)
+    clean = app.load_data()
+    if not (raw["patient"].equals(clean["patient"]) and raw["Date"].equals(clean["Date"])):
+        sys.exit("row order of load_data() does not match the CSV")
+
+    baseline = raw[app.FEATURES]
+    old_proba = model.predict_proba(baseline)[:, 1]
+    old_label = model.predict(baseline) == 1
+
+    # The category and int8 columns from load_data must reach the preprocessor
+    # unchanged, so the transformed matrices have to match bit for bit.
+    old_x = _dense(preprocessor.transform(baseline))
+    new_x = _dense(preprocessor.transform(app.model_input(clean)))
+    if not np.array_equal(old_x, new_x):
+        bad = np.flatnonzero((old_x != new_x).any(axis=0))
+        print(f"transformed features differ in columns: {bad.tolist()}")
+
+    new_proba = booster.inplace_predict(new_x)
+    new_label = new_proba > 0.5
+
+    label_diff = old_label != new_label
+    risk_diff = (old_proba * 100).astype(int) != (new_proba * 100).astype(int)
+    # Rows are sorted by (patient, Date), so each patient's last row is the dashboard's visit.
+    latest = raw["patient"].ne(raw["patient"].shift(-1)).to_numpy()
+
+    print(f"rows: {len(raw)}, label flips: {label_diff.sum()}, risk % changes: {risk_diff.sum()}")
+    print(f"latest visits: {latest.sum()}, label flips: {(label_diff & latest).sum()}, "
+          f"risk % changes: {(risk_diff & latest).sum()}")
+    if label_diff.any() or risk_diff.any() or not np.array_equal(old_x, new_x):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()